@@ -2,11 +2,14 @@
 FastAPI routes for Churn Prediction API.
 Handles HTTP endpoints for single and batch predictions.
 """
-import io
+import os
+import json
+import asyncio
 import traceback
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 import pandas as pd
-import numpy as np
-from fastapi import FastAPI, HTTPException, UploadFile, File
+from fastapi import FastAPI, HTTPException, UploadFile, File, Response, Query
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel
 from typing import List
@@ -14,6 +17,7 @@ from dotenv import load_dotenv
 
 from utils.model_loader import load_model
 from utils.extract import extract_context
+from utils.data_preprocessing import CHURN_DTYPES
 from services.prediction_service import predict_single, predict_batch
 from services.shap_service import get_top_features
 from services.ai_service import (
@@ -22,6 +26,7 @@ from services.ai_service import (
     generate_batch_strategy_prompt
 )
 from services.batch_service import analyze_high_risk_group
+from services.micro_batcher import MicroBatcher
 
 load_dotenv()
 
@@ -31,8 +36,26 @@ model = load_model('data/best_churn_model.pkl')
 # Load company context
 context = extract_context('data/policies.txt')
 
+
+# Coalesces concurrent /predict requests into one model call (started with the app)
+micro_batcher = MicroBatcher(model) if model else None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Install a dedicated thread pool for model work and start the micro-batcher."""
+    executor = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix="churn-predict")
+    asyncio.get_running_loop().set_default_executor(executor)
+    if micro_batcher:
+        micro_batcher.start()
+    yield
+    if micro_batcher:
+        await micro_batcher.stop()
+    executor.shutdown(wait=False)
+
+
 # Initialize FastAPI app
-app = FastAPI(title="Churn Prediction API")
+app = FastAPI(title="Churn Prediction API", lifespan=lifespan)
 
 # CORS configuration
 app.add_middleware(
@@ -46,6 +69,9 @@ app.add_middleware(
 # Global storage for latest prediction (used for explainability)
 latest_prediction_storage = {}
 
+# Number of top SHAP drivers /explain_shap sends to Gemini
+EXPLAIN_TOP_N = 5
+
 
 # --- DATA MODELS ---
 class CustomerProfile(BaseModel):
@@ -77,15 +103,17 @@ class PredictionResponse(BaseModel):
     churn_probability: float
     shap_values: List[float]
     feature_names: List[str]
+    shap_indices: List[int]
 
 
 # --- ENDPOINTS ---
 @app.post("/predict", response_model=PredictionResponse)
-async def predict_single_endpoint(customer: CustomerProfile):
+async def predict_single_endpoint(customer: CustomerProfile, top_k: int = Query(10, ge=0)):
     """
     Predict churn for a single customer.
     
     Returns prediction, probability, SHAP values, and feature names.
+    Only the top_k features by absolute SHAP value are returned (0 for all).
     """
     global latest_prediction_storage
     
@@ -96,8 +124,14 @@ async def predict_single_endpoint(customer: CustomerProfile):
         # Convert customer profile to dict
         input_data = customer.model_dump()
         
-        # Get prediction using service
-        result = predict_single(model, input_data)
+        # Score the customer together with other in-flight requests
+        prob = await micro_batcher.submit(input_data)
+        
+        # Get prediction and SHAP values using service (off the event loop).
+        # Keep at least EXPLAIN_TOP_N features for /explain_shap, even if the
+        # client asked for fewer (features come back sorted by |SHAP| when top_k > 0).
+        stored_k = max(top_k, EXPLAIN_TOP_N) if top_k else 0
+        result = await asyncio.to_thread(predict_single, model, input_data, prob, stored_k)
         
         # Store for explainability endpoint
         latest_prediction_storage = {
@@ -105,6 +139,15 @@ async def predict_single_endpoint(customer: CustomerProfile):
             "shap_values": result["shap_values"],
             "feature_names": result["feature_names"]
         }
+        
+        # Trim the response to the requested top_k
+        if top_k and top_k < stored_k:
+            result = {
+                **result,
+                "shap_values": result["shap_values"][:top_k],
+                "feature_names": result["feature_names"][:top_k],
+                "shap_indices": result["shap_indices"][:top_k]
+            }
 
         return result
 
@@ -126,12 +169,13 @@ async def predict_batch_analysis_endpoint(file: UploadFile = File(...)):
         raise HTTPException(status_code=500, detail="Model not loaded")
 
     try:
-        # Read CSV file
-        contents = await file.read()
-        df = pd.read_csv(io.BytesIO(contents))
+        # Parse CSV straight from the spooled upload with the Arrow parser (off the event loop)
+        df = await asyncio.to_thread(pd.read_csv, file.file, engine="pyarrow", dtype=CHURN_DTYPES)
         
-        # Get batch predictions (with SHAP for high-risk customers)
-        results_df, df_clean, probs, shap_aggregate = predict_batch(model, df, include_shap=True)
+        # Get batch predictions (with SHAP for high-risk customers) off the event loop
+        results_df, df_clean, probs, shap_aggregate = await asyncio.to_thread(
+            predict_batch, model, df, include_shap=True
+        )
         
         # Analyze high-risk group (with SHAP insights)
         summary_stats = analyze_high_risk_group(df_clean, probs, shap_aggregate)
@@ -146,11 +190,11 @@ async def predict_batch_analysis_endpoint(file: UploadFile = File(...)):
         # Get AI-generated report
         report = await get_gemini_explanation(prompt)
         
-        # Return data + report (Convert DF to dict for JSON response)
-        return {
-            "strategy_report": report,
-            "data": results_df.replace({np.nan: None}).to_dict(orient="records")
-        }
+        # Return data + report. The records are serialized by pandas' C JSON writer
+        # (NaN -> null), which avoids a NaN-replaced copy and one Python dict per row.
+        records_json = results_df.to_json(orient="records")
+        body = f'{{"strategy_report": {json.dumps(report)}, "data": {records_json}}}'
+        return Response(content=body, media_type="application/json")
 
     except Exception as e:
         traceback.print_exc()
@@ -178,7 +222,7 @@ async def explain_shap_endpoint():
         top_5 = get_top_features(
             data["shap_values"],
             data["feature_names"],
-            top_n=5
+            top_n=EXPLAIN_TOP_N
         )
         
         # Generate explanation prompt
@@ -2,6 +2,12 @@
 AI service for generating explanations and strategy reports using Gemini.
 """
 import os
+import asyncio
+import hashlib
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+from string import Template
 import google.generativeai as genai
 from dotenv import load_dotenv
 
@@ -11,12 +17,111 @@ genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 model = genai.GenerativeModel("gemini-3-flash-preview")
 
+# Cap the number of in-flight Gemini requests shared by all endpoints
+GEMINI_MAX_CONCURRENCY = int(os.getenv("GEMINI_MAX_CONCURRENCY", "8"))
+
+# One semaphore per event loop; an asyncio.Semaphore binds to the loop it first waits on
+_gemini_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = (
+    weakref.WeakKeyDictionary()
+)
+
+
+def _get_semaphore() -> asyncio.Semaphore:
+    """Return the Gemini concurrency semaphore for the running event loop."""
+    loop = asyncio.get_running_loop()
+    semaphore = _gemini_semaphores.get(loop)
+    if semaphore is None:
+        semaphore = asyncio.Semaphore(GEMINI_MAX_CONCURRENCY)
+        _gemini_semaphores[loop] = semaphore
+    return semaphore
+
+# Exact-match LRU cache of Gemini responses, keyed by SHA-256 of the prompt
+RESPONSE_CACHE_SIZE = 512
+_response_cache: "OrderedDict[str, str]" = OrderedDict()
+
+
+def _cache_key(prompt: str) -> str:
+    """Hash a prompt into a fixed-size cache key."""
+    return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str):
+    """Return a cached response and mark it as recently used, or None."""
+    text = _response_cache.get(key)
+    if text is not None:
+        _response_cache.move_to_end(key)
+    return text
+
+
+def _cache_put(key: str, text: str) -> None:
+    """Store a response, evicting the least recently used entry when full."""
+    _response_cache[key] = text
+    _response_cache.move_to_end(key)
+    if len(_response_cache) > RESPONSE_CACHE_SIZE:
+        _response_cache.popitem(last=False)
+
 
 async def get_gemini_explanation(prompt: str) -> str:
-    response = model.generate_content(prompt)
+    """
+    Send a prompt to Gemini without blocking the event loop.
+    
+    Identical prompts are answered from an in-process LRU cache.
+    
+    Args:
+        prompt: Prompt text
+        
+    Returns:
+        Generated response text
+    """
+    key = _cache_key(prompt)
+    cached = _cache_get(key)
+    if cached is not None:
+        return cached
+    
+    async with _get_semaphore():
+        response = await model.generate_content_async(prompt)
+    
+    _cache_put(key, response.text)
     return response.text
 
 
+# Prompt templates; $context is inlined once per context string by _with_context
+_SHAP_EXPLANATION_PROMPT = Template("""
+    Act as a Retention Manager. Analyze this customer and company context:
+    Churn Risk: $churn_risk ($risk_level)
+    company context: $context
+    
+    Top Drivers:
+    $top_drivers
+    
+    Briefly explain why they might leave and suggest 1 retention action.
+    """)
+
+_BATCH_STRATEGY_PROMPT = Template("""
+    You are a generic Strategy Consultant. 
+    I have analyzed a batch of $total_customers customers. Here is the summary of the "At Risk" segment:
+    
+    $summary_stats
+    company context: $context
+    
+    Based on these stats, feature importance data (SHAP values), and company context, provide a brief "Retention Strategy Report" with:
+    1. **Executive Summary**: What is the main problem? Focus on the top churn drivers identified.
+    2. **3 Actionable Strategies**: Specific things to do, prioritized by the feature importance data. For example:
+       - If "Contract" is a top driver, suggest contract upgrade incentives
+       - If "Tenure" is important, focus on early-stage retention programs
+       - If "PaymentMethod" matters, offer payment plan options
+    
+    Keep it professional, concise, and use markdown formatting. Prioritize strategies based on the feature importance rankings.
+    """)
+
+
+@lru_cache(maxsize=8)
+def _with_context(template: Template, context: str) -> Template:
+    """Inline the company context into a prompt template once, leaving the per-call fields."""
+    escaped = context.replace("$", "$$")
+    return Template(template.template.replace("$context", escaped))
+
+
 def generate_shap_explanation_prompt(
     churn_probability: float,  
     top_features: list,
@@ -37,18 +142,11 @@ def generate_shap_explanation_prompt(
     
     top_drivers = "\n".join([f"- {f[0]}: {f[1]:.3f}" for f in top_features])
     
-    prompt = f"""
-    Act as a Retention Manager. Analyze this customer and company context:
-    Churn Risk: {churn_probability:.1%} ({risk_level})
-    company context: {context}
-    
-    Top Drivers:
-    {top_drivers}
-    
-    Briefly explain why they might leave and suggest 1 retention action.
-    """
-    
-    return prompt
+    return _with_context(_SHAP_EXPLANATION_PROMPT, context).substitute(
+        churn_risk=f"{churn_probability:.1%}",
+        risk_level=risk_level,
+        top_drivers=top_drivers
+    )
 
 
 def generate_batch_strategy_prompt(
@@ -67,21 +165,7 @@ def generate_batch_strategy_prompt(
     Returns:
         Formatted prompt string
     """
-    prompt = f"""
-    You are a generic Strategy Consultant. 
-    I have analyzed a batch of {total_customers} customers. Here is the summary of the "At Risk" segment:
-    
-    {summary_stats}
-    company context: {context}
-    
-    Based on these stats, feature importance data (SHAP values), and company context, provide a brief "Retention Strategy Report" with:
-    1. **Executive Summary**: What is the main problem? Focus on the top churn drivers identified.
-    2. **3 Actionable Strategies**: Specific things to do, prioritized by the feature importance data. For example:
-       - If "Contract" is a top driver, suggest contract upgrade incentives
-       - If "Tenure" is important, focus on early-stage retention programs
-       - If "PaymentMethod" matters, offer payment plan options
-    
-    Keep it professional, concise, and use markdown formatting. Prioritize strategies based on the feature importance rankings.
-    """
-    
-    return prompt
+    return _with_context(_BATCH_STRATEGY_PROMPT, context).substitute(
+        total_customers=total_customers,
+        summary_stats=summary_stats
+    )
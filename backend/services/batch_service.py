@@ -6,6 +6,29 @@ import numpy as np
 from typing import Dict, Any, Tuple, Optional
 
 
+def _most_frequent(values: pd.Series) -> Optional[Any]:
+    """
+    Return the most frequent non-null value in a column (ties go to the smallest, like mode()).
+    
+    Uses a hash-based value count, one O(N) pass with no sort of the column.
+    
+    Args:
+        values: Column values
+        
+    Returns:
+        Most frequent value, or None if there are no non-null values
+    """
+    counts = values.value_counts(sort=False)
+    if counts.empty:
+        return None
+    
+    count_arr = counts.to_numpy()
+    top_count = count_arr.max()
+    if top_count == 0:  # categorical column whose categories are all absent here
+        return None
+    return min(counts.index[count_arr == top_count])
+
+
 def analyze_high_risk_group(df_clean: pd.DataFrame, probs: np.ndarray, shap_aggregate: Optional[Dict] = None) -> str:
     """
     Analyze high-risk customer group and generate summary statistics.
@@ -25,17 +48,19 @@ def analyze_high_risk_group(df_clean: pd.DataFrame, probs: np.ndarray, shap_aggr
     if high_risk_df.empty:
         return "Great news! Very few high-risk customers detected."
     
-    # Get top categorical frequent values in high risk group
+    # Get top categorical frequent values in high risk group (one value count per column)
     cat_summary = []
     for col in ['Contract', 'InternetService', 'PaymentMethod', 'TechSupport']:
         if col in high_risk_df.columns:
-            mode_result = high_risk_df[col].mode()
-            if not mode_result.empty:
-                top_val = mode_result[0]
+            top_val = _most_frequent(high_risk_df[col])
+            if top_val is not None:
                 cat_summary.append(f"{col}: {top_val}")
     
-    avg_tenure = high_risk_df['tenure'].mean() if 'tenure' in high_risk_df.columns else 0
-    avg_charge = high_risk_df['MonthlyCharges'].mean() if 'MonthlyCharges' in high_risk_df.columns else 0
+    # Average numeric columns in a single agg call
+    num_cols = [col for col in ['tenure', 'MonthlyCharges'] if col in high_risk_df.columns]
+    num_means = high_risk_df[num_cols].agg('mean') if num_cols else {}
+    avg_tenure = num_means.get('tenure', 0)
+    avg_charge = num_means.get('MonthlyCharges', 0)
     
     # Build summary stats
     summary_stats = f"""
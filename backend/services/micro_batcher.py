@@ -0,0 +1,153 @@
+"""
+Micro-batching service for single-customer predictions.
+Coalesces concurrent /predict requests into one model call.
+"""
+import asyncio
+from typing import Dict, Any, List, Optional, Tuple
+
+from services.prediction_service import predict_proba_batch
+
+
+class MicroBatcher:
+    """
+    Queue single-row prediction requests and score them in small batches.
+
+    A background task waits for the first queued row, then keeps collecting
+    rows until max_batch_size is reached or max_wait_ms has passed, and runs
+    predict_proba once for the whole batch in a worker thread. While a batch
+    is being scored, new requests keep queueing and form the next batch.
+
+    If scoring the batch raises (e.g. one row the pipeline rejects), each row
+    of that batch is re-scored on its own, so only the offending requests get
+    the error and the others still get their probability.
+
+    The queue and task are bound to the event loop that starts them. submit()
+    (re)starts them when they are missing, have stopped, or belong to another
+    loop, so the batcher works with or without an app lifespan.
+    """
+
+    def __init__(
+        self,
+        model,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 5.0,
+        request_timeout: Optional[float] = 30.0
+    ):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.request_timeout = request_timeout
+        self._queue: Optional["asyncio.Queue[Tuple[Dict[str, Any], asyncio.Future]]"] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def start(self) -> None:
+        """Start the background batching task on the running event loop, if not already running there."""
+        loop = asyncio.get_running_loop()
+        if self._task is not None and not self._task.done() and self._loop is loop:
+            return
+
+        queue = asyncio.Queue()
+        self._loop = loop
+        self._queue = queue
+        self._task = loop.create_task(self._run(queue))
+        self._task.add_done_callback(lambda task: self._on_task_done(task, queue))
+
+    async def stop(self) -> None:
+        """Cancel the background task; requests still waiting fail with RuntimeError."""
+        task = self._task
+        self._task = None
+        if task is not None and not task.done() and self._loop is asyncio.get_running_loop():
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+    async def submit(self, customer_data: Dict[str, Any]) -> float:
+        """
+        Queue one customer and wait for its churn probability.
+
+        Args:
+            customer_data: Dictionary of customer features
+
+        Returns:
+            Churn probability for the customer
+        """
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((customer_data, future))
+        return await asyncio.wait_for(future, self.request_timeout)
+
+    @staticmethod
+    def _score_rows_individually(model, rows: List[Dict[str, Any]]) -> List[Any]:
+        """Score each row on its own; returns a probability or the raised exception per row."""
+        outcomes: List[Any] = []
+        for row in rows:
+            try:
+                outcomes.append(float(predict_proba_batch(model, [row])[0]))
+            except Exception as e:
+                outcomes.append(e)
+        return outcomes
+
+    @staticmethod
+    def _fail(batch: List[Tuple[Dict[str, Any], asyncio.Future]], error: BaseException) -> None:
+        """Fail every still-pending future in a batch."""
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
+
+    def _on_task_done(self, task: asyncio.Task, queue: asyncio.Queue) -> None:
+        """Fail requests left in the queue when the background task exits."""
+        if task.cancelled():
+            error: BaseException = RuntimeError("Micro-batcher stopped")
+        else:
+            error = task.exception() or RuntimeError("Micro-batcher stopped")
+
+        pending = []
+        while not queue.empty():
+            pending.append(queue.get_nowait())
+        self._fail(pending, error)
+
+    async def _collect(self, queue: asyncio.Queue, batch: List[Tuple[Dict[str, Any], asyncio.Future]]) -> None:
+        """Wait for one request, then gather more until the batch is full or the window closes."""
+        loop = asyncio.get_running_loop()
+        batch.append(await queue.get())
+        deadline = loop.time() + self.max_wait
+
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+
+    async def _run(self, queue: asyncio.Queue) -> None:
+        """Background loop: collect a batch, score it off the event loop, resolve callers."""
+        while True:
+            batch: List[Tuple[Dict[str, Any], asyncio.Future]] = []
+            try:
+                await self._collect(queue, batch)
+                rows = [row for row, _ in batch]
+
+                try:
+                    outcomes = await asyncio.to_thread(predict_proba_batch, self.model, rows)
+                except Exception:
+                    # Isolate the failing rows so one bad input doesn't fail the whole batch
+                    outcomes = await asyncio.to_thread(self._score_rows_individually, self.model, rows)
+
+                for (_, future), outcome in zip(batch, outcomes):
+                    if future.done():
+                        continue
+                    if isinstance(outcome, Exception):
+                        future.set_exception(outcome)
+                    else:
+                        future.set_result(float(outcome))
+            except asyncio.CancelledError:
+                self._fail(batch, RuntimeError("Micro-batcher stopped"))
+                raise
+            except BaseException as e:
+                self._fail(batch, e)
+                raise
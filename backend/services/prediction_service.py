@@ -4,43 +4,71 @@ Handles single and batch predictions.
 """
 import pandas as pd
 import numpy as np
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
 from utils.data_preprocessing import clean_data
 from services.shap_service import calculate_shap_values
 
 
-def predict_single(model, customer_data: Dict[str, Any]) -> Dict[str, Any]:
+def predict_single(
+    model,
+    customer_data: Dict[str, Any],
+    churn_probability: Optional[float] = None,
+    top_k: Optional[int] = None
+) -> Dict[str, Any]:
     """
     Predict churn for a single customer.
     
     Args:
         model: Trained model pipeline
         customer_data: Dictionary of customer features
+        churn_probability: Probability already computed for this customer
+            (e.g. by the micro-batcher); skips the model call if given
+        top_k: Return SHAP values only for the top_k features (None for all)
         
     Returns:
-        Dictionary with prediction, probability, SHAP values, and feature names
+        Dictionary with prediction, probability, SHAP values, feature names
+        and the features' indices in the model's full feature list
     """
     # Convert to DataFrame
     df = pd.DataFrame([customer_data])
     
-    # Clean data
-    df_clean = clean_data(df)
+    # Clean data (the frame is local, so clean it in place)
+    df_clean = clean_data(df, copy=False)
     
-    # Predict
-    pred = model.predict(df_clean)[0]
-    prob = model.predict_proba(df_clean)[0][1]
+    # Predict (label derived from the probability, same as the classifier's argmax)
+    if churn_probability is None:
+        prob = model.predict_proba(df_clean)[0][1]
+    else:
+        prob = churn_probability
+    pred = prob > 0.5
     
     # Calculate SHAP values
-    shap_vals, feature_names = calculate_shap_values(model, df_clean)
+    shap_vals, feature_names, feature_indices = calculate_shap_values(model, df_clean, top_k=top_k)
     
     return {
         "prediction": int(pred),
         "churn_probability": float(prob),
         "shap_values": shap_vals,
-        "feature_names": feature_names
+        "feature_names": feature_names,
+        "shap_indices": feature_indices
     }
 
 
+def predict_proba_batch(model, rows: List[Dict[str, Any]]) -> np.ndarray:
+    """
+    Predict churn probabilities for several customers in one model call.
+    
+    Args:
+        model: Trained model pipeline
+        rows: List of customer feature dictionaries
+        
+    Returns:
+        Array of churn probabilities, in the same order as rows
+    """
+    df_clean = clean_data(pd.DataFrame(rows), copy=False)
+    return model.predict_proba(df_clean)[:, 1]
+
+
 def predict_batch(model, df: pd.DataFrame, include_shap: bool = True):
     """
     Predict churn for a batch of customers.
@@ -62,18 +90,21 @@ def predict_batch(model, df: pd.DataFrame, include_shap: bool = True):
     
     # Predict
     probs = model.predict_proba(df_clean)[:, 1]
-    preds = model.predict(df_clean)
+    
+    # Boolean mask of high-risk rows, computed once and reused below
+    high_risk_mask = probs > 0.6
     
     # Attach results
     results_df = df.copy()
-    results_df['Churn_Probability'] = probs
-    results_df['Risk_Level'] = np.where(probs > 0.6, 'High', 'Low')
+    results_df['Churn_Probability'] = probs.astype(np.float32)
+    results_df['Risk_Level'] = pd.Categorical.from_codes(
+        high_risk_mask.astype(np.int8), categories=['Low', 'High']
+    )
     
     # Calculate SHAP for high-risk customers if requested
     shap_aggregate = None
     if include_shap:
         from services.shap_service import calculate_batch_shap_aggregate
-        high_risk_mask = probs > 0.6
         if high_risk_mask.any():
             high_risk_data = df_clean[high_risk_mask]
             shap_aggregate = calculate_batch_shap_aggregate(model, high_risk_data)
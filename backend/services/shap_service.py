@@ -4,45 +4,143 @@ Calculates SHAP values to explain model predictions.
 """
 import shap
 import numpy as np
-from typing import List, Tuple
+from scipy import sparse
+from typing import List, Optional, Tuple
 
 
-def calculate_shap_values(model, preprocessed_data):
+def _get_step(model, name: str):
+    """
+    Get a pipeline step, preferring the reference bound at load time.
+    
+    Args:
+        model: Trained model pipeline
+        name: Step name ('preprocessor' or 'classifier')
+        
+    Returns:
+        The pipeline step
+    """
+    step = getattr(model, f'_{name}', None)
+    if step is None:
+        step = model.named_steps[name]
+        setattr(model, f'_{name}', step)
+    return step
+
+
+def get_explainer(model):
+    """
+    Get the cached TreeExplainer for a model pipeline.
+    
+    The explainer is built at load time by the model loader; if it is missing
+    it is built here once and cached on the model for later requests.
+    
+    Args:
+        model: Trained model pipeline
+        
+    Returns:
+        shap.TreeExplainer for the pipeline's classifier
+    """
+    explainer = getattr(model, '_shap_explainer', None)
+    if explainer is None:
+        explainer = shap.TreeExplainer(_get_step(model, 'classifier'))
+        model._shap_explainer = explainer
+    return explainer
+
+
+def get_feature_names(model) -> List[str]:
+    """
+    Get the cached names of the preprocessor's output columns.
+    
+    These line up one-to-one with the SHAP values. Like the explainer, they
+    are cached on the model at load time and built here if missing.
+    
+    Args:
+        model: Trained model pipeline
+        
+    Returns:
+        List of transformed feature names
+    """
+    feature_names = getattr(model, '_feature_names', None)
+    if feature_names is None:
+        feature_names = list(_get_step(model, 'preprocessor').get_feature_names_out())
+        model._feature_names = feature_names
+    return feature_names
+
+
+def _mean_abs_topk(shap_vals: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Mean absolute SHAP value per feature and the indices of the k largest.
+    
+    Args:
+        shap_vals: 2-D array of SHAP values (rows x features); overwritten with |values|
+        k: Number of top features to select
+        
+    Returns:
+        Tuple of (top_indices sorted by descending importance, mean_abs_values)
+    """
+    np.abs(shap_vals, out=shap_vals)
+    mean_abs = shap_vals.mean(axis=0)
+    
+    k = min(k, mean_abs.size)
+    top_idx = np.argpartition(mean_abs, -k)[-k:]
+    top_idx = top_idx[np.argsort(mean_abs[top_idx])[::-1]]
+    return top_idx, mean_abs
+
+
+def _to_dense_float32(X):
+    """Convert preprocessor output to a C-contiguous float32 array."""
+    if sparse.issparse(X):
+        X = X.toarray()
+    return np.ascontiguousarray(X, dtype=np.float32)
+
+
+def calculate_shap_values(model, preprocessed_data, top_k: Optional[int] = None):
     """
     Calculate SHAP values for model predictions.
     
     Args:
         model: Trained model pipeline
         preprocessed_data: Preprocessed DataFrame ready for prediction
+        top_k: If set, keep only the top_k features by absolute SHAP value
+            (sorted by descending impact); None or 0 returns every feature
         
     Returns:
-        Tuple of (shap_values, feature_names)
+        Tuple of (shap_values, feature_names, feature_indices), where
+        feature_indices are the positions of the returned features in the
+        model's full feature list
     """
-    # Extract components from pipeline
-    preprocessor = model.named_steps['preprocessor']
-    classifier = model.named_steps['classifier']
+    # Extract preprocessor from pipeline
+    preprocessor = _get_step(model, 'preprocessor')
     
     # Transform using the pipeline's preprocessor
     X_transformed = preprocessor.transform(preprocessed_data)
     
     # Calculate SHAP
-    explainer = shap.TreeExplainer(classifier)
+    explainer = get_explainer(model)
     shap_vals = explainer.shap_values(X_transformed)
     
     # Handle SHAP output format (LightGBM binary often returns list of arrays)
     if isinstance(shap_vals, list):
         shap_vals = shap_vals[1]  # Class 1 (Churn)
     
-    # Flatten if needed
-    if hasattr(shap_vals, 'flatten'):
-        shap_vals = shap_vals.flatten().tolist()
-    else:
-        shap_vals = shap_vals.tolist()
+    # Flatten to one value per feature
+    shap_vals = np.asarray(shap_vals).ravel()
     
-    # Get feature names from input data
-    feature_names = list(preprocessed_data.columns)
+    # Get names of the transformed features the SHAP values refer to
+    feature_names = get_feature_names(model)
     
-    return shap_vals, feature_names
+    # Select the top_k features by absolute SHAP value
+    if top_k and top_k < shap_vals.size:
+        abs_vals = np.abs(shap_vals)
+        indices = np.argpartition(abs_vals, -top_k)[-top_k:]
+        indices = indices[np.argsort(abs_vals[indices])[::-1]]
+    else:
+        indices = np.arange(shap_vals.size)
+    
+    return (
+        shap_vals[indices].tolist(),
+        [feature_names[i] for i in indices],
+        indices.tolist()
+    )
 
 
 def get_top_features(shap_values: List[float], feature_names: List[str], top_n: int = 5) -> List[Tuple[str, float]]:
@@ -62,13 +160,21 @@ def get_top_features(shap_values: List[float], feature_names: List[str], top_n:
     return feats[:top_n]
 
 
-def calculate_batch_shap_aggregate(model, high_risk_data):
+# Max high-risk rows explained for the batch aggregate (larger groups are sampled)
+SHAP_SAMPLE_SIZE = 1024
+
+
+def calculate_batch_shap_aggregate(model, high_risk_data, exact: bool = False):
     """
     Calculate aggregate SHAP values for a batch of high-risk customers.
     
+    Groups larger than SHAP_SAMPLE_SIZE are explained on a fixed-seed uniform
+    sample, so the mean |SHAP| values are an unbiased estimate of the group's.
+    
     Args:
         model: Trained model pipeline
         high_risk_data: DataFrame with high-risk customer data
+        exact: Explain every row instead of a sample
         
     Returns:
         Dictionary with aggregate SHAP statistics
@@ -76,37 +182,40 @@ def calculate_batch_shap_aggregate(model, high_risk_data):
     if high_risk_data.empty:
         return None
     
-    # Extract components from pipeline
-    preprocessor = model.named_steps['preprocessor']
-    classifier = model.named_steps['classifier']
+    # Sample large groups; the ranking only needs an estimate of the mean |SHAP|
+    if not exact and len(high_risk_data) > SHAP_SAMPLE_SIZE:
+        high_risk_data = high_risk_data.sample(n=SHAP_SAMPLE_SIZE, random_state=0)
     
-    # Transform using the pipeline's preprocessor
-    X_transformed = preprocessor.transform(high_risk_data)
+    # Extract preprocessor from pipeline
+    preprocessor = _get_step(model, 'preprocessor')
     
-    # Calculate SHAP for all high-risk customers
-    explainer = shap.TreeExplainer(classifier)
-    shap_vals = explainer.shap_values(X_transformed)
+    # Transform using the pipeline's preprocessor into one dense float32 block
+    X_transformed = _to_dense_float32(preprocessor.transform(high_risk_data))
+    
+    # Calculate SHAP for all high-risk customers. Only the mean |SHAP| ranking is
+    # needed here, so the additivity check is disabled. For LightGBM this is a
+    # no-op (SHAP uses the booster's pred_contrib and never checks additivity);
+    # it only matters if the classifier is swapped for another tree model.
+    # approximate=True is not supported by SHAP for LightGBM models.
+    explainer = get_explainer(model)
+    shap_vals = explainer.shap_values(X_transformed, check_additivity=False)
     
     # Handle SHAP output format (LightGBM binary often returns list of arrays)
     if isinstance(shap_vals, list):
         shap_vals = shap_vals[1]  # Class 1 (Churn)
     
-    # Convert to numpy array if needed
-    if not isinstance(shap_vals, np.ndarray):
-        shap_vals = np.array(shap_vals)
-    
-    # Get feature names
-    feature_names = list(high_risk_data.columns)
+    # Convert to a float numpy array if needed (freshly allocated by SHAP, safe to modify)
+    shap_vals = np.asarray(shap_vals, dtype=np.float64)
     
-    # Calculate mean absolute SHAP values (aggregate importance)
-    mean_shap = np.mean(np.abs(shap_vals), axis=0)
+    # Get names of the transformed features the SHAP values refer to
+    feature_names = get_feature_names(model)
     
-    # Get top features by average absolute SHAP value
-    top_features = list(zip(feature_names, mean_shap))
-    top_features.sort(key=lambda x: abs(x[1]), reverse=True)
+    # Mean absolute SHAP values (aggregate importance) and the top 10 drivers
+    top_idx, mean_shap = _mean_abs_topk(shap_vals, k=10)
+    top_features = [(feature_names[i], float(mean_shap[i])) for i in top_idx]
     
     return {
-        'top_features': top_features[:10],  # Top 10 drivers
+        'top_features': top_features,
         'mean_shap_values': mean_shap.tolist(),
         'feature_names': feature_names
     }
@@ -5,41 +5,66 @@ Applies the same preprocessing steps as the training script.
 import pandas as pd
 
 
-def clean_data(df: pd.DataFrame) -> pd.DataFrame:
+# Known column types of the customer CSV, so the parser skips type inference
+# for the text columns. Numeric columns (SeniorCitizen, tenure, MonthlyCharges)
+# are left to the parser: blank cells must stay NaN and fractional values must
+# not be truncated, as with the untyped parser.
+# TotalCharges stays text (blank for new customers) and is converted in clean_data.
+# Columns normalized by clean_data are left as object, since replacing values
+# in a categorical column would change its categories.
+CHURN_DTYPES = {
+    'customerID': 'object',
+    'gender': 'category',
+    'Partner': 'category',
+    'Dependents': 'category',
+    'PhoneService': 'category',
+    'InternetService': 'category',
+    'Contract': 'category',
+    'PaperlessBilling': 'category',
+    'PaymentMethod': 'category',
+    'TotalCharges': 'object',
+}
+
+# Normalize Categorical Values (Match Training Logic)
+# The training script replaced 'No internet service' with 'No'
+REPLACE_COLS = [
+    'MultipleLines', 'OnlineSecurity', 'OnlineBackup', 
+    'DeviceProtection', 'TechSupport', 'StreamingTV', 'StreamingMovies'
+]
+
+# Per-column replacement map, built once so clean_data needs a single replace pass
+_REPLACE_MAP = {
+    col: {'No internet service': 'No', 'No phone service': 'No'}
+    for col in REPLACE_COLS
+}
+
+
+def clean_data(df: pd.DataFrame, copy: bool = True) -> pd.DataFrame:
     """
     Applies the same preprocessing steps as the training script.
     
     Args:
         df: Raw DataFrame with customer data
+        copy: Work on a copy of df. Pass False when the caller owns the
+            frame and does not need the raw data afterwards.
         
     Returns:
         Cleaned DataFrame ready for model prediction
     """
-    df = df.copy()
-    
-    # Drop ID if present
-    if 'customerID' in df.columns:
-        df = df.drop(columns=['customerID'])
+    if copy:
+        df = df.copy()
     
-    # Drop target column if present (for prediction, we don't need the actual churn value)
-    if 'Churn' in df.columns:
-        df = df.drop(columns=['Churn'])
+    # Drop ID and target column if present (for prediction, we don't need the actual churn value)
+    drop_cols = [col for col in ['customerID', 'Churn'] if col in df.columns]
+    if drop_cols:
+        df.drop(columns=drop_cols, inplace=True)
 
     # Handle TotalCharges (Convert to numeric, coerce errors to NaN, fill with 0)
     # Remove any empty spaces or strange characters
     if 'TotalCharges' in df.columns:
         df['TotalCharges'] = pd.to_numeric(df['TotalCharges'], errors='coerce').fillna(0)
 
-    # Normalize Categorical Values (Match Training Logic)
-    # The training script replaced 'No internet service' with 'No'
-    replace_cols = [
-        'MultipleLines', 'OnlineSecurity', 'OnlineBackup', 
-        'DeviceProtection', 'TechSupport', 'StreamingTV', 'StreamingMovies'
-    ]
-    
-    for col in replace_cols:
-        if col in df.columns:
-            df[col] = df[col].replace('No internet service', 'No')
-            df[col] = df[col].replace('No phone service', 'No')
+    # Columns missing from df are skipped by DataFrame.replace
+    df.replace(_REPLACE_MAP, inplace=True)
 
     return df
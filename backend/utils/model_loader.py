@@ -4,21 +4,106 @@ Handles loading and initialization of the trained churn prediction model.
 """
 import joblib
 import os
+import shap
+import pandas as pd
 
+from utils.data_preprocessing import clean_data
 
-def load_model(model_path: str = 'data/best_churn_model.pkl'):
+
+# Typical customer used to warm up the model right after loading
+_WARMUP_PROFILE = {
+    "gender": "Male",
+    "SeniorCitizen": 0,
+    "Partner": "No",
+    "Dependents": "No",
+    "tenure": 12,
+    "PhoneService": "Yes",
+    "MultipleLines": "No",
+    "InternetService": "Fiber optic",
+    "OnlineSecurity": "No",
+    "OnlineBackup": "No",
+    "DeviceProtection": "No",
+    "TechSupport": "No",
+    "StreamingTV": "Yes",
+    "StreamingMovies": "Yes",
+    "Contract": "Month-to-month",
+    "PaperlessBilling": "Yes",
+    "PaymentMethod": "Electronic check",
+    "MonthlyCharges": 70.0,
+    "TotalCharges": "840.0",
+}
+
+
+def warmup_model(model, n_runs: int = 2) -> None:
+    """
+    Run a few throwaway predictions so the first real request doesn't pay
+    for page faults and thread-pool start-up.
+    
+    Args:
+        model: Trained model pipeline
+        n_runs: Number of warmup predictions
+    """
+    df_clean = clean_data(pd.DataFrame([_WARMUP_PROFILE]), copy=False)
+    for _ in range(n_runs):
+        model.predict_proba(df_clean)
+
+
+def prepare_model(model, n_jobs: int = 1) -> None:
+    """
+    Cache pipeline steps, the SHAP explainer and feature names on the model,
+    then warm it up.
+    
+    Failures are logged and leave the model usable: shap_service rebuilds
+    anything missing on first use, so a SHAP problem only affects the requests
+    that need SHAP.
+    
+    Args:
+        model: Trained model pipeline
+        n_jobs: Threads LightGBM uses per prediction
+    """
+    try:
+        # Bind the pipeline steps once so request paths skip named_steps lookups
+        model._preprocessor = model.named_steps['preprocessor']
+        model._classifier = model.named_steps['classifier']
+        
+        # Avoid oversubscribing the CPU with OpenMP threads from concurrent requests
+        model._classifier.set_params(n_jobs=n_jobs)
+        
+        # Build the SHAP explainer once; it only depends on the fitted trees
+        model._shap_explainer = shap.TreeExplainer(model._classifier)
+        
+        # Names of the transformed columns the classifier (and SHAP) sees
+        model._feature_names = list(model._preprocessor.get_feature_names_out())
+    except Exception as e:
+        print(f"WARNING: Model setup (SHAP explainer / feature names) failed: {e}")
+    
+    try:
+        warmup_model(model)
+    except Exception as e:
+        print(f"WARNING: Model warmup prediction failed: {e}")
+
+
+def load_model(model_path: str = 'data/best_churn_model.pkl', n_jobs: int = 1):
     """
     Load the trained churn prediction model.
     
+    The pickle is loaded with mmap_mode='r'. For this pipeline that only maps
+    a couple of tiny label arrays; the LightGBM booster and the preprocessor
+    are still loaded into each process's memory.
+    
     Args:
         model_path: Path to the model file
+        n_jobs: Threads LightGBM uses per prediction. Defaults to 1 because
+            requests already run in parallel on the server's thread pool.
         
     Returns:
         Loaded model or None if loading fails
     """
     try:
-        model = joblib.load(model_path)
-        return model
+        model = joblib.load(model_path, mmap_mode='r')
     except Exception as e:
         print(f"WARNING: Model file not found. Please ensure '{model_path}' exists. Error: {e}")
         return None
+    
+    prepare_model(model, n_jobs=n_jobs)
+    return model